@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from enum import Enum
 from typing import List, Any, Dict, Literal, Optional
 import dspy
@@ -6,6 +6,10 @@ import os
 import logging
 import json
 import argparse
+import hashlib
+import threading
+
+from json_utils import dump_json, load_json, parse_json
 
 # Configuración de logging
 logging.basicConfig(
@@ -23,9 +27,22 @@ GEMINI_CONFIG = {
     "temperature": 0
 }
 
+# Directorio de caché para evaluaciones ya realizadas por el LLM
+LLM_CACHE_DIR = "outputs/.llm_cache"
+
+# Versión de la caché del LLM: incrementarla al cambiar los prompts o el formato
+# de las firmas para no reutilizar evaluaciones anteriores
+LLM_CACHE_VERSION = "2"
+
+# Número de parejas CV-JD que se envían juntas en un mismo prompt
+BATCH_SIZE = 4
+
 # Report of the match between the CV and the JD.
 
 class ReportOutput(BaseModel):
+    # Inmutable y sin validación por asignación: se crea una vez por evaluación
+    model_config = ConfigDict(frozen=True, validate_assignment=False)
+
     text: str = Field(..., description="Report of the match between the CV and the JD.")
 
 class MatchLevel(str, Enum):
@@ -35,6 +52,8 @@ class MatchLevel(str, Enum):
     MUY_BAJO = "muy_bajo"
 
 class ClassificationResult(BaseModel):
+    model_config = ConfigDict(frozen=True, validate_assignment=False)
+
     match_level: MatchLevel = Field(..., description="Match level between sections of the CV and the JD.")
     report: ReportOutput = Field(..., description="Report of the match between the CV and the JD.")
 
@@ -49,6 +68,13 @@ class Evaluate(dspy.Signature):
     result: ClassificationResult = dspy.OutputField(desc="Result of the evaluation.")
 
 
+class EvaluateBatch(dspy.Signature):
+    """Evaluate the match between each CV and JD pair."""
+
+    pairs: List[Dict[str, str]] = dspy.InputField(desc="CV/JD pairs, each with the keys 'cv', 'jd' and 'scores'.")
+    results: List[ClassificationResult] = dspy.OutputField(desc="One result per pair, in the same order as the input.")
+
+
 def configure_llm(model_name=None, api_key=None, temperature=None, max_tokens=None):
     """Configure the LLM for evaluation."""
     # Usar valores de GEMINI_CONFIG por defecto si no se proporcionan
@@ -71,16 +97,35 @@ def configure_llm(model_name=None, api_key=None, temperature=None, max_tokens=No
     return lm
 
 
+# Módulos evaluadores compartidos entre llamadas (se construyen una sola vez)
+_evaluators = {}
+_evaluator_lock = threading.Lock()
+
+
+def _get_evaluator(signature=Evaluate):
+    """Devuelve el módulo ChainOfThought de la firma, configurando el LLM si aún no lo está."""
+    evaluator = _evaluators.get(signature)
+    if evaluator is None:
+        with _evaluator_lock:
+            evaluator = _evaluators.get(signature)
+            if evaluator is None:
+                if dspy.settings.lm is None:
+                    configure_llm()
+                evaluator = _evaluators[signature] = dspy.ChainOfThought(signature)
+    return evaluator
+
+
+# Umbral mínimo de score para cada nivel, de mayor a menor
+_MATCH_THRESHOLDS = (
+    (0.7, MatchLevel.ALTO),
+    (0.5, MatchLevel.MEDIO),
+    (0.3, MatchLevel.BAJO),
+)
+
+
 def determine_match_level(score):
     """Determina el nivel de coincidencia basado en el puntaje total."""
-    if score >= 0.7:
-        return MatchLevel.ALTO
-    elif score >= 0.5:
-        return MatchLevel.MEDIO
-    elif score >= 0.3:
-        return MatchLevel.BAJO
-    else:
-        return MatchLevel.MUY_BAJO
+    return next((level for threshold, level in _MATCH_THRESHOLDS if score >= threshold), MatchLevel.MUY_BAJO)
 
 
 def format_prompt_data(cv_data, jd_data, scores_data):
@@ -106,9 +151,7 @@ def format_prompt_data(cv_data, jd_data, scores_data):
     
     # Incluir scores
     section_scores = scores_data.get("scores", {})
-    section_scores_text = ""
-    for section, score in section_scores.items():
-        section_scores_text += f"- {section}: {score*100:.1f}%\n"
+    section_scores_text = "".join(f"- {section}: {score*100:.1f}%\n" for section, score in section_scores.items())
     
     total_score = scores_data.get("total_score", 0)
     match_level = determine_match_level(total_score)
@@ -134,10 +177,122 @@ Scores por sección:
     return prompt_data, match_level
 
 
+def _make_result(match_level, text):
+    """Construye un ClassificationResult con valores ya válidos, sin revalidarlos."""
+    return ClassificationResult.model_construct(
+        match_level=match_level,
+        report=ReportOutput.model_construct(text=text)
+    )
+
+
+def _as_dict(data, label):
+    """Convierte un string JSON en diccionario; si no es JSON válido, lo envuelve."""
+    if not isinstance(data, str):
+        return data
+    try:
+        return parse_json(data)
+    except:
+        logger.warning(f"{label} text no es JSON válido, usando como está")
+        return {"texto_completo": data}
+
+
+def _cache_key(cv_str, jd_str, scores, signature=Evaluate):
+    """
+    Genera una clave estable a partir del contenido evaluado, la firma (prompt)
+    usada y el modelo configurado con sus parámetros.
+    """
+    lm = dspy.settings.lm
+    model = getattr(lm, 'model', None)
+    # La API key no afecta al resultado: se excluye para que cambiarla no invalide la caché
+    lm_kwargs = {k: v for k, v in (getattr(lm, 'kwargs', None) or {}).items() if k != 'api_key'}
+    lm_str = json.dumps(lm_kwargs, sort_keys=True, ensure_ascii=False, default=str)
+    scores_str = json.dumps(scores, sort_keys=True, ensure_ascii=False)
+    prompt_str = f"{LLM_CACHE_VERSION}:{signature.__name__}:{signature.instructions}"
+    
+    # CV y JD ya están serializados: se hashean directamente sin volver a codificarlos en JSON
+    digest = hashlib.sha256()
+    for part in (cv_str, jd_str, scores_str, prompt_str, str(model), lm_str):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _load_cached_result(key):
+    """Recupera una evaluación previa de la caché en disco, o None si no existe."""
+    cache_path = os.path.join(LLM_CACHE_DIR, f"{key}.json")
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return ClassificationResult.model_validate_json(f.read())
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Entrada de caché inválida {cache_path}: {e}")
+        return None
+
+
+def _store_cached_result(key, result):
+    """Guarda una evaluación del LLM en la caché en disco."""
+    cache_path = os.path.join(LLM_CACHE_DIR, f"{key}.json")
+    try:
+        os.makedirs(LLM_CACHE_DIR, exist_ok=True)
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            f.write(result.model_dump_json())
+    except Exception as e:
+        logger.warning(f"No se pudo guardar la evaluación en caché: {e}")
+
+
+def _parse_result(raw_result, match_level):
+    """Convierte un resultado de dspy en ClassificationResult, o None si no es posible."""
+    if raw_result is None:
+        return None
+    
+    # Verificar el resultado
+    if isinstance(raw_result, ClassificationResult):
+        return raw_result
+    
+    # Si el resultado no está en el formato esperado, crear uno
+    if hasattr(raw_result, 'match_level') and hasattr(raw_result, 'report'):
+        # Construir manualmente para asegurar el formato correcto
+        return ClassificationResult(
+            match_level=raw_result.match_level,
+            report=ReportOutput(text=raw_result.report.text)
+        )
+    elif isinstance(raw_result, dict):
+        # Extraer del diccionario
+        return ClassificationResult(
+            match_level=raw_result.get('match_level', match_level),
+            report=ReportOutput(text=raw_result.get('report', {}).get('text', 'No report generated.'))
+        )
+    
+    return None
+
+
+def _prepare_inputs(cv_text, jd_text, scores):
+    """Prepara las entradas del LLM: (cv_str, jd_str, scores_input, match_level)."""
+    # Serializar solo si se recibió un diccionario; los strings se envían tal cual
+    cv_str = cv_text if isinstance(cv_text, str) else json.dumps(cv_text, ensure_ascii=False)
+    jd_str = jd_text if isinstance(jd_text, str) else json.dumps(jd_text, ensure_ascii=False)
+    
+    # Si hay scores, formatear el prompt
+    scores_input = ""
+    match_level = MatchLevel.MUY_BAJO
+    
+    if scores:
+        # Solo aquí se necesitan las secciones como diccionarios
+        cv_data = _as_dict(cv_text, "CV")
+        jd_data = _as_dict(jd_text, "JD")
+        scores_input, match_level = format_prompt_data(cv_data, jd_data, scores)
+    
+    return cv_str, jd_str, scores_input, match_level
+
+
 def evaluate_match(cv_text, jd_text, scores=None):
     """
     Evaluate the match between a CV and a JD.
     
+    Results produced by the LLM are cached on disk under LLM_CACHE_DIR, keyed
+    by the CV, JD and scores content, so unchanged pairs are not re-evaluated.
+    
     Args:
         cv_text (str): The CV content as JSON string or dict.
         jd_text (str): The JD content as JSON string or dict.
@@ -147,74 +302,127 @@ def evaluate_match(cv_text, jd_text, scores=None):
         ClassificationResult: The evaluation result with match level and report.
     """
     try:
-        # Preparar evaluador
-        evaluator = dspy.ChainOfThought(Evaluate)
-        
-        # Convertir a diccionarios si son strings JSON
-        if isinstance(cv_text, str):
-            try:
-                cv_data = json.loads(cv_text)
-            except:
-                logger.warning("CV text no es JSON válido, usando como está")
-                cv_data = {"texto_completo": cv_text}
-        else:
-            cv_data = cv_text
-            
-        if isinstance(jd_text, str):
-            try:
-                jd_data = json.loads(jd_text)
-            except:
-                logger.warning("JD text no es JSON válido, usando como está")
-                jd_data = {"texto_completo": jd_text}
-        else:
-            jd_data = jd_text
+        cv_str, jd_str, scores_input, match_level = _prepare_inputs(cv_text, jd_text, scores)
         
-        # Si hay scores, formatear el prompt
-        scores_input = ""
-        match_level = MatchLevel.MUY_BAJO
+        # Preparar evaluador
+        evaluator = _get_evaluator()
         
-        if scores:
-            scores_input, match_level = format_prompt_data(cv_data, jd_data, scores)
+        # Reutilizar una evaluación previa si el contenido no ha cambiado
+        cache_key = _cache_key(cv_str, jd_str, scores)
+        cached = _load_cached_result(cache_key)
+        if cached is not None:
+            logger.info("Evaluación recuperada de caché")
+            return cached
         
         # Realizar evaluación
         prediction = evaluator(
-            cv=json.dumps(cv_data, ensure_ascii=False),
-            jd=json.dumps(jd_data, ensure_ascii=False),
+            cv=cv_str,
+            jd=jd_str,
             scores=scores_input
         )
         
-        # Verificar el resultado
-        if hasattr(prediction, 'result') and isinstance(prediction.result, ClassificationResult):
-            return prediction.result
-        
-        # Si el resultado no está en el formato esperado, crear uno
-        if hasattr(prediction, 'result'):
-            if hasattr(prediction.result, 'match_level') and hasattr(prediction.result, 'report'):
-                # Construir manualmente para asegurar el formato correcto
-                return ClassificationResult(
-                    match_level=prediction.result.match_level,
-                    report=ReportOutput(text=prediction.result.report.text)
-                )
-            elif isinstance(prediction.result, dict):
-                # Extraer del diccionario
-                return ClassificationResult(
-                    match_level=prediction.result.get('match_level', match_level),
-                    report=ReportOutput(text=prediction.result.get('report', {}).get('text', 'No report generated.'))
-                )
+        result = _parse_result(getattr(prediction, 'result', None), match_level)
+        if result is not None:
+            _store_cached_result(cache_key, result)
+            return result
         
         # Fallback: generar resultado basado en scores si disponibles
-        return ClassificationResult(
-            match_level=match_level,
-            report=ReportOutput(text=f"Evaluación automática basada en score: {match_level.value.upper()}")
-        )
+        return _make_result(match_level, f"Evaluación automática basada en score: {match_level.value.upper()}")
         
     except Exception as e:
         logger.error(f"Error evaluando match: {e}")
         # Retornar un resultado por defecto en caso de error
-        return ClassificationResult(
-            match_level=MatchLevel.MUY_BAJO,
-            report=ReportOutput(text=f"Error al evaluar: {str(e)}")
-        )
+        return _make_result(MatchLevel.MUY_BAJO, f"Error al evaluar: {str(e)}")
+
+def evaluate_batch(items):
+    """
+    Evaluate several CV/JD pairs, sending up to BATCH_SIZE pairs per LLM call.
+    
+    Cached pairs are served from disk. If a batch call fails or returns a
+    different number of results, its pairs are evaluated one by one with
+    evaluate_match.
+    
+    Args:
+        items (list): Tuples (cv_text, jd_text, scores) as accepted by evaluate_match.
+        
+    Returns:
+        list: One ClassificationResult per item, in the same order.
+    """
+    results = [None] * len(items)
+    pending = []
+    
+    try:
+        evaluator = _get_evaluator(EvaluateBatch)
+        
+        for idx, (cv_text, jd_text, scores) in enumerate(items):
+            cv_str, jd_str, scores_input, match_level = _prepare_inputs(cv_text, jd_text, scores)
+            
+            # Reutilizar una evaluación previa si el contenido no ha cambiado
+            cache_key = _cache_key(cv_str, jd_str, scores, EvaluateBatch)
+            cached = _load_cached_result(cache_key)
+            if cached is not None:
+                results[idx] = cached
+                continue
+            
+            pair = {"cv": cv_str, "jd": jd_str, "scores": scores_input}
+            pending.append((idx, cache_key, match_level, pair))
+        
+        for start in range(0, len(pending), BATCH_SIZE):
+            chunk = pending[start:start + BATCH_SIZE]
+            try:
+                # Ampliar el límite de tokens del LLM configurado en proporción al número de parejas
+                pair_tokens = dspy.settings.lm.kwargs.get("max_tokens", GEMINI_CONFIG["max_tokens"])
+                lm = dspy.settings.lm.copy(max_tokens=pair_tokens * len(chunk))
+                with dspy.context(lm=lm):
+                    prediction = evaluator(pairs=[pair for _, _, _, pair in chunk])
+            except Exception as e:
+                logger.error(f"Error evaluando lote de {len(chunk)} parejas: {e}")
+                continue
+            
+            batch_results = getattr(prediction, 'results', None) or []
+            if len(batch_results) != len(chunk):
+                logger.warning(f"El lote devolvió {len(batch_results)} resultados para {len(chunk)} parejas")
+                continue
+            
+            for (idx, cache_key, match_level, _), raw_result in zip(chunk, batch_results):
+                result = _parse_result(raw_result, match_level)
+                if result is not None:
+                    _store_cached_result(cache_key, result)
+                    results[idx] = result
+    
+    except Exception as e:
+        logger.error(f"Error preparando evaluación por lotes: {e}")
+    
+    # Evaluar individualmente las parejas que no se resolvieron en lote
+    for idx, (cv_text, jd_text, scores) in enumerate(items):
+        if results[idx] is None:
+            results[idx] = evaluate_match(cv_text, jd_text, scores)
+    
+    return results
+
+def _save_evaluation(cv_path, jd_path, scores_data, result, output_path):
+    """Guarda la evaluación de una pareja CV-JD en JSON."""
+    cv_name = os.path.splitext(os.path.basename(cv_path))[0]
+    jd_name = os.path.splitext(os.path.basename(jd_path))[0]
+    
+    evaluation = {
+        "cv_name": cv_name,
+        "jd_name": jd_name,
+        "match_level": result.match_level.value,
+        "report": result.report.text,
+        "score": scores_data.get("total_score", 0)
+    }
+    
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    dump_json(evaluation, output_path)
+    logger.info(f"Evaluación guardada en: {output_path}")
+
+def _load_evaluation_inputs(cv_path, jd_path, score_path):
+    """Carga los JSON de CV, JD y scores."""
+    cv_data = load_json(cv_path)
+    jd_data = load_json(jd_path)
+    scores_data = load_json(score_path)
+    return cv_data, jd_data, scores_data
 
 def evaluate_from_files(cv_path, jd_path, score_path, output_path=None):
     """
@@ -231,43 +439,54 @@ def evaluate_from_files(cv_path, jd_path, score_path, output_path=None):
     """
     try:
         # Cargar archivos
-        with open(cv_path, 'r', encoding='utf-8') as f:
-            cv_data = json.load(f)
-        
-        with open(jd_path, 'r', encoding='utf-8') as f:
-            jd_data = json.load(f)
-        
-        with open(score_path, 'r', encoding='utf-8') as f:
-            scores_data = json.load(f)
+        cv_data, jd_data, scores_data = _load_evaluation_inputs(cv_path, jd_path, score_path)
             
         # Evaluar con los datos cargados
         result = evaluate_match(cv_data, jd_data, scores_data)
         
-        # Crear objeto evaluación para guardarlo
-        cv_name = os.path.splitext(os.path.basename(cv_path))[0]
-        jd_name = os.path.splitext(os.path.basename(jd_path))[0]
-        
-        evaluation = {
-            "cv_name": cv_name,
-            "jd_name": jd_name,
-            "match_level": result.match_level.value,
-            "report": result.report.text,
-            "score": scores_data.get("total_score", 0)
-        }
-        
         # Guardar evaluación si se especificó ruta
         if output_path:
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(evaluation, f, ensure_ascii=False, indent=4)
-            logger.info(f"Evaluación guardada en: {output_path}")
+            _save_evaluation(cv_path, jd_path, scores_data, result, output_path)
         
         return result
     
     except Exception as e:
         logger.error(f"Error evaluando desde archivos: {e}")
         # Retornar un resultado por defecto en caso de error
-        return ClassificationResult(
-            match_level=MatchLevel.MUY_BAJO,
-            report=ReportOutput(text=f"Error al evaluar desde archivos: {str(e)}")
-        )
\ No newline at end of file
+        return _make_result(MatchLevel.MUY_BAJO, f"Error al evaluar desde archivos: {str(e)}")
+
+def evaluate_batch_from_files(file_sets):
+    """
+    Evalúa varias parejas CV-JD desde archivos, agrupándolas en lotes para el LLM.
+    
+    Args:
+        file_sets (list): Tuplas (cv_path, jd_path, score_path, output_path);
+            output_path puede ser None para no guardar la evaluación
+        
+    Returns:
+        list: Un ClassificationResult por tupla, en el mismo orden
+    """
+    results = [None] * len(file_sets)
+    positions = []
+    items = []
+    
+    # Cargar archivos; las parejas que fallen reciben un resultado de error
+    for idx, (cv_path, jd_path, score_path, _) in enumerate(file_sets):
+        try:
+            items.append(_load_evaluation_inputs(cv_path, jd_path, score_path))
+            positions.append(idx)
+        except Exception as e:
+            logger.error(f"Error evaluando desde archivos: {e}")
+            results[idx] = _make_result(MatchLevel.MUY_BAJO, f"Error al evaluar desde archivos: {str(e)}")
+    
+    # Evaluar en lote y guardar cada resultado
+    for idx, (_, _, scores_data), result in zip(positions, items, evaluate_batch(items)):
+        cv_path, jd_path, _, output_path = file_sets[idx]
+        if output_path:
+            try:
+                _save_evaluation(cv_path, jd_path, scores_data, result, output_path)
+            except Exception as e:
+                logger.error(f"Error al guardar evaluación en {output_path}: {e}")
+        results[idx] = result
+    
+    return results
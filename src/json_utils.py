@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import json
+
+# orjson es opcional: si no está instalado se usa el módulo json estándar
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def dump_json(data, path):
+    """
+    Guarda datos en un archivo JSON (UTF-8, indentado).
+    Usa orjson si está disponible; si no, json estándar.
+    """
+    if orjson is not None:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+def load_json(path):
+    """
+    Carga un archivo JSON.
+    Usa orjson si está disponible; si no, json estándar.
+    """
+    if orjson is not None:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def parse_json(text):
+    """
+    Convierte un string JSON en objetos Python.
+    Lanza ValueError si el texto no es JSON válido.
+    """
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
@@ -1,8 +1,8 @@
 import os
-import glob
 import time
 import json
 import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -15,6 +15,12 @@ import evaluator
 # Cargar variables de entorno
 load_dotenv()
 
+# Por debajo de este número de archivos no compensa arrancar procesos
+MIN_FILES_FOR_POOL = 4
+
+# Máximo de evaluaciones LLM concurrentes (limitado por la cuota del proveedor)
+MAX_LLM_WORKERS = 8
+
 # Configurar logging
 logging.basicConfig(
     level=logging.INFO,
@@ -37,6 +43,52 @@ def setup_directories():
         os.makedirs(dir_path, exist_ok=True)
         logger.info(f"Verificada carpeta: {dir_path}")
 
+def list_files(dir_path, suffix):
+    """Lista los archivos (no ocultos) de un directorio con la extensión indicada."""
+    if not os.path.isdir(dir_path):
+        return []
+    with os.scandir(dir_path) as entries:
+        return [
+            entry.path for entry in entries
+            if entry.name.endswith(suffix) and not entry.name.startswith('.') and entry.is_file()
+        ]
+
+def process_files(process_fn, file_paths, doc_type):
+    """
+    Aplica process_fn a cada archivo y devuelve las rutas JSON generadas.
+    
+    Cada archivo es independiente: a partir de MIN_FILES_FOR_POOL se reparten
+    en un ProcessPoolExecutor; con menos, se procesan en el propio proceso
+    para no pagar el arranque del pool. No se usan hilos porque PyMuPDF no es
+    seguro entre hilos.
+    """
+    json_paths = []
+    start_time = time.time()
+    
+    def collect(file_path, get_result):
+        try:
+            json_path = get_result()
+            if json_path:
+                json_paths.append(json_path)
+                logger.info(f"{doc_type} procesado: {os.path.basename(file_path)}")
+            else:
+                logger.error(f"Error al procesar {doc_type}: {file_path}")
+        except Exception as e:
+            logger.error(f"Excepción al procesar {doc_type} {file_path}: {e}")
+    
+    if len(file_paths) < MIN_FILES_FOR_POOL:
+        for file_path in file_paths:
+            collect(file_path, lambda: process_fn(file_path))
+    else:
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            futures = {executor.submit(process_fn, file_path): file_path for file_path in file_paths}
+            for future in as_completed(futures):
+                collect(futures[future], future.result)
+    
+    duration = time.time() - start_time
+    logger.info(f"{len(json_paths)} {doc_type}s procesados en {duration:.2f}s")
+    return json_paths
+
 def process_documents():
     """Procesa todos los CVs y JDs disponibles.
     
@@ -49,47 +101,23 @@ def process_documents():
     """
     # Procesamiento de CVs
     cv_jsons = []
-    cv_files = glob.glob('data/cvs/*.pdf')
+    cv_files = list_files('data/cvs', '.pdf')
     
     if not cv_files:
         logger.warning("No se encontraron archivos PDF de CV")
     else:
         logger.info(f"Encontrados {len(cv_files)} CVs para procesar")
-    
-    for cv_path in cv_files:
-        try:
-            start_time = time.time()
-            json_path = processor_cvs.process_cv_simplified(cv_path)
-            if json_path:
-                cv_jsons.append(json_path)
-                duration = time.time() - start_time
-                logger.info(f"CV procesado: {os.path.basename(cv_path)} ({duration:.2f}s)")
-            else:
-                logger.error(f"Error al procesar CV: {cv_path}")
-        except Exception as e:
-            logger.error(f"Excepción al procesar CV {cv_path}: {e}")
+        cv_jsons = process_files(processor_cvs.process_cv_simplified, cv_files, "CV")
     
     # Procesamiento de JDs
     jd_jsons = []
-    jd_files = glob.glob('data/jds/*.txt')
+    jd_files = list_files('data/jds', '.txt')
     
     if not jd_files:
         logger.warning("No se encontraron archivos de JD")
     else:
         logger.info(f"Encontrados {len(jd_files)} JDs para procesar")
-    
-    for jd_path in jd_files:
-        try:
-            start_time = time.time()
-            json_path = processor_jds.process_jd(jd_path)
-            if json_path:
-                jd_jsons.append(json_path)
-                duration = time.time() - start_time
-                logger.info(f"JD procesado: {os.path.basename(jd_path)} ({duration:.2f}s)")
-            else:
-                logger.error(f"Error al procesar JD: {jd_path}")
-        except Exception as e:
-            logger.error(f"Excepción al procesar JD {jd_path}: {e}")
+        jd_jsons = process_files(processor_jds.process_jd, jd_files, "JD")
     
     return cv_jsons, jd_jsons
 
@@ -106,10 +134,13 @@ def run_comparison(cv_jsons, jd_jsons):
     all_results = {}
     
     try:
+        # Cargar y generar los embeddings de los JDs una sola vez para todos los CVs
+        jd_embeddings = similarity.precompute_jd_embeddings(jd_jsons)
+        
         for cv_path in cv_jsons:
             start_time = time.time()
             # Llamar a similarity.compare_cv_to_jds con un solo CV y todos los JDs
-            cv_results = similarity.compare_cv_to_jds(cv_path, jd_jsons)
+            cv_results = similarity.compare_cv_to_jds(cv_path, jd_jsons, jd_embeddings=jd_embeddings)
             
             # Organizar por JD (manteniendo solo el mejor CV por JD)
             for result in cv_results:
@@ -133,50 +164,35 @@ def run_comparison(cv_jsons, jd_jsons):
         logger.error(f"Error durante la comparación: {e}")
         return None
 
-def evaluate_match(cv_path, jd_path, score_path):
+def evaluate_matches(pairs):
     """
-    Evalúa una coincidencia específica entre CV y JD.
+    Evalúa varias coincidencias CV-JD en una sola llamada por lotes al LLM.
     
     Args:
-        cv_path: Ruta al archivo JSON del CV
-        jd_path: Ruta al archivo JSON del JD
-        score_path: Ruta al archivo JSON con los scores
+        pairs: Lista de tuplas (cv_path, jd_path, score_path)
         
     Returns:
-        Un diccionario con la evaluación o None si ocurre un error
+        Lista de diccionarios de evaluación, en el mismo orden que pairs
     """
-    # Configurar LLM (usa la configuración por defecto de GEMINI_CONFIG)
-    try:
-        evaluator.configure_llm()
-        logger.info("LLM configurado correctamente")
-    except Exception as e:
-        logger.error(f"Error al configurar LLM: {e}")
-        return None
+    file_sets = []
+    for cv_path, jd_path, score_path in pairs:
+        cv_name = os.path.splitext(os.path.basename(cv_path))[0]
+        jd_name = os.path.splitext(os.path.basename(jd_path))[0]
+        output_path = f"outputs/evaluations/{cv_name}_vs_{jd_name}_eval.json"
+        file_sets.append((cv_path, jd_path, score_path, output_path))
     
-    # Crear nombre de archivo para la evaluación
-    cv_name = os.path.splitext(os.path.basename(cv_path))[0]
-    jd_name = os.path.splitext(os.path.basename(jd_path))[0]
-    output_path = f"outputs/evaluations/{cv_name}_vs_{jd_name}_eval.json"
+    logger.info(f"Evaluando lote de {len(pairs)} coincidencias")
+    results = evaluator.evaluate_batch_from_files(file_sets)
     
-    # Evaluar coincidencia
-    try:
-        logger.info(f"Evaluando coincidencia: {cv_name} vs {jd_name}")
-        result = evaluator.evaluate_from_files(cv_path, jd_path, score_path, output_path)
-        
-        # Crear diccionario de evaluación para devolver
-        evaluation = {
-            "cv_name": cv_name,
-            "jd_name": jd_name,
+    evaluations = []
+    for (cv_path, jd_path, _, _), result in zip(file_sets, results):
+        evaluations.append({
+            "cv_name": os.path.splitext(os.path.basename(cv_path))[0],
+            "jd_name": os.path.splitext(os.path.basename(jd_path))[0],
             "match_level": result.match_level.value,
             "report": result.report.text
-        }
-        
-        logger.info(f"Evaluación completada y guardada en: {output_path}")
-        return evaluation
-    
-    except Exception as e:
-        logger.error(f"Error al evaluar {cv_name} vs {jd_name}: {e}")
-        return None
+        })
+    return evaluations
 
 def print_results(best_matches, evaluations=None):
     """Imprime los resultados de las comparaciones 1:1."""
@@ -258,7 +274,16 @@ def main():
         # Inicializar diccionario para almacenar evaluaciones
         evaluations = {}
         
+        # Configurar LLM una sola vez (usa la configuración por defecto de GEMINI_CONFIG)
+        try:
+            evaluator.configure_llm()
+            logger.info("LLM configurado correctamente")
+        except Exception as e:
+            logger.error(f"Error al configurar LLM: {e}")
+            return
+        
         # Evaluar solo el mejor match por cada JD
+        tasks = []
         for jd_name, matches in best_matches.items():
             if not matches:
                 continue
@@ -276,14 +301,27 @@ def main():
             if not os.path.exists(cv_path) or not os.path.exists(jd_path) or not os.path.exists(score_path):
                 logger.warning(f"Faltan archivos para evaluar {cv_name} vs {jd_name}")
                 continue
-                
-            # Evaluar coincidencia
-            evaluation = evaluate_match(cv_path, jd_path, score_path)
             
-            if evaluation:
-                if jd_name not in evaluations:
-                    evaluations[jd_name] = []
-                evaluations[jd_name].append(evaluation)
+            tasks.append((cv_path, jd_path, score_path))
+        
+        # Agrupar las parejas en lotes; cada lote es una sola llamada al LLM.
+        # Las llamadas esperan red: los lotes se lanzan en paralelo con hilos
+        batches = [tasks[i:i + evaluator.BATCH_SIZE] for i in range(0, len(tasks), evaluator.BATCH_SIZE)]
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(MAX_LLM_WORKERS, len(batches))) as executor:
+                futures = [executor.submit(evaluate_matches, batch) for batch in batches]
+                for future in as_completed(futures):
+                    try:
+                        batch_evaluations = future.result()
+                    except Exception as e:
+                        logger.error(f"Error al evaluar lote: {e}")
+                        continue
+                    
+                    for evaluation in batch_evaluations:
+                        jd_name = evaluation['jd_name']
+                        if jd_name not in evaluations:
+                            evaluations[jd_name] = []
+                        evaluations[jd_name].append(evaluation)
         
         # Mostrar resultados con evaluación
         if evaluations:
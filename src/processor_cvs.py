@@ -1,20 +1,105 @@
 # -*- coding: utf-8 -*-
 import fitz  # PyMuPDF
 import re
-import json
 import os
+import mmap
+import hashlib
 from pathlib import Path
 
-def extract_text_from_pdf(pdf_path):
-    """Extrae texto de un archivo PDF."""
+from json_utils import dump_json
+
+# Patrones precompilados para el inicio de cada sección
+_SECTION_PATTERNS = {
+    name: re.compile(pattern)
+    for name, pattern in {
+        'perfil': r'(?:datos\s+personales|información\s+personal|perfil|sobre\s+mi|acerca\s+de\s+mi|experiencia|habilidad|competencia|capacidad|aptitud|conocimiento)',
+        'formacion': r'(?:educación|formación|estudios|certificaciones|cursos)',
+        'experiencia': r'(?:experiencia|experiencia\s+laboral|experiencia\s+profesional)',
+        'habilidades': r'(?:habilidades|competencias|capacidades|aptitudes|conocimientos|skills|stack|tecnologías)'
+    }.items()
+}
+
+# Viñetas que marcan elementos de una lista
+_BULLETS = ('-', '•')
+_BULLET_STRIP = '- •'
+
+# Patrones precompilados para la normalización y extracción
+_SPECIAL_CHARS_RE = re.compile(r'[^\w\s,áéíóúüñ]')
+_WHITESPACE_RE = re.compile(r'\s+')
+_YEAR_RE = re.compile(r'\b(19|20)\d{2}\b')
+
+# Extracción de texto plano sin análisis de imágenes
+_TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# Versión de la extracción: forma parte del hash guardado junto a cada JSON,
+# por lo que debe incrementarse cada vez que cambie el resultado de la extracción
+_EXTRACTOR_VERSION = "2"
+
+# Tamaño máximo (bytes) de un PDF para abrirlo desde memoria en lugar de desde disco
+_MAX_IN_MEMORY_PDF_SIZE = 2 * 1024 * 1024
+
+# Títulos académicos comunes
+_EDUCATION_KEYWORDS = [
+    'licenciatura', 'licenciado', 'ingeniero', 'ingeniería', 'técnico', 
+    'máster', 'master', 'doctorado', 'phd', 'grado', 'bachiller', 'profesional', 'maestría',
+    'diplomado', 'curso', 'certificación', 'certificado', 'formación', 'especialización', 'postgrado',
+]
+
+# Posiciones laborales comunes
+_POSITION_KEYWORDS = [
+    'director', 'gerente', 'jefe', 'coordinador', 'supervisor', 'analista',
+    'desarrollador', 'ingeniero', 'técnico', 'asistente', 'consultor',
+    'encargado', 'responsable'
+]
+
+# Habilidades técnicas comunes para identificar
+_TECHNICAL_SKILLS = [
+    'java', 'python', 'c++', 'javascript', 'html', 'css', 'sql', 'php',
+    'ruby', 'excel', 'word', 'powerpoint', 'linux', 'windows', 'docker',
+    'aws', 'azure', 'office', 'sap', 'jira', 'git', 'react', 'angular',
+    'vue', 'node.js', 'django', 'flask', 'spring', 'rest', 'api',
+    'mongodb', 'mysql', 'postgresql', 'oracle'
+]
+
+# Alternaciones precompiladas: una sola pasada del motor de regex por línea
+_EDUCATION_RE = re.compile('|'.join(re.escape(k) for k in _EDUCATION_KEYWORDS))
+_POSITION_RE = re.compile('|'.join(re.escape(k) for k in _POSITION_KEYWORDS))
+_SKILL_RE = re.compile('|'.join(re.escape(k) for k in _TECHNICAL_SKILLS))
+
+def _read_small_pdf(pdf_path):
+    """
+    Lee de una vez el contenido de un PDF pequeño (hasta _MAX_IN_MEMORY_PDF_SIZE).
+    Devuelve None si el PDF es más grande y debe abrirse desde disco.
+    """
+    if os.path.getsize(pdf_path) > _MAX_IN_MEMORY_PDF_SIZE:
+        return None
+    with open(pdf_path, 'rb') as f:
+        return f.read()
+
+def iter_pdf_pages(pdf_path, pdf_data=None):
+    """
+    Recorre un PDF página a página, generando el texto de cada página.
+    Si se recibe pdf_data (ver _read_small_pdf), el PDF se abre desde esos bytes
+    sin volver a leer el archivo.
+    """
+    # Los PDFs pequeños se leen de una vez y se abren desde memoria
+    if pdf_data is None:
+        pdf_data = _read_small_pdf(pdf_path)
+    
+    if pdf_data is not None:
+        doc = fitz.open(stream=pdf_data, filetype='pdf')
+    else:
+        doc = fitz.open(pdf_path, filetype='pdf')
+    
+    with doc:
+        for page in doc:
+            yield page.get_text("text", flags=_TEXT_FLAGS)
+
+def extract_text_from_pdf(pdf_path, pdf_data=None):
+    """Extrae texto de un archivo PDF (opcionalmente ya leído, ver iter_pdf_pages)."""
     try:
-        doc = fitz.open(pdf_path)
-        text = ""
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            text += page.get_text()
-        doc.close()
-        return text
+        # Unir al final evita copias cuadráticas del texto
+        return "".join(iter_pdf_pages(pdf_path, pdf_data))
     except Exception as e:
         print(f"Error procesando PDF {pdf_path}: {e}")
         return None
@@ -22,6 +107,7 @@ def extract_text_from_pdf(pdf_path):
 def identify_sections(text):
     """
     Identifica las secciones ordenadas por su aparición en el documento.
+    Devuelve el contenido de cada sección ya normalizado (ver normalize_text).
     """
     # Convertir todo a minúsculas para la búsqueda
     text_lower = text.lower()
@@ -29,17 +115,9 @@ def identify_sections(text):
     # Diccionario para almacenar las posiciones de inicio de cada sección
     section_starts = {}
     
-    # Patrones para el inicio de cada sección
-    section_patterns = {
-        'perfil': r'(?:datos\s+personales|información\s+personal|perfil|sobre\s+mi|acerca\s+de\s+mi|experiencia|habilidad|competencia|capacidad|aptitud|conocimiento)',
-        'formacion': r'(?:educación|formación|estudios|certificaciones|cursos)',
-        'experiencia': r'(?:experiencia|experiencia\s+laboral|experiencia\s+profesional)',
-        'habilidades': r'(?:habilidades|competencias|capacidades|aptitudes|conocimientos|skills|stack|tecnologías)'
-    }
-    
     # Encontrar dónde comienza cada sección
-    for section_name, pattern in section_patterns.items():
-        matches = re.search(pattern, text_lower)
+    for section_name, pattern in _SECTION_PATTERNS.items():
+        matches = pattern.search(text_lower)
         if matches:
             section_starts[section_name] = matches.start()
     
@@ -53,17 +131,18 @@ def identify_sections(text):
     # Crear diccionario con el contenido de cada sección
     sections = {}
     
-    # Para cada sección, extraer su contenido
+    # Para cada sección, extraer su contenido. Se toma del texto ya en minúsculas
+    # y se normaliza aquí una sola vez para todos los extractores
     for i, (section_name, start_pos) in enumerate(sorted_sections):
         # Si es la última sección, su contenido va hasta el final
         if i == len(sorted_sections) - 1:
-            section_content = text[start_pos:]
+            section_content = text_lower[start_pos:]
         else:
             # Si no es la última, su contenido va hasta donde empieza la siguiente
             next_section_start = sorted_sections[i + 1][1]
-            section_content = text[start_pos:next_section_start]
+            section_content = text_lower[start_pos:next_section_start]
         
-        sections[section_name] = section_content.strip()
+        sections[section_name] = _clean_text(section_content)
     
     return sections
 
@@ -75,23 +154,24 @@ def normalize_text(text):
     - Elimina espacios extra
     """
     # Convertir a minúsculas
-    text = text.lower()
-    
+    return _clean_text(text.lower())
+
+def _clean_text(text):
+    """Elimina signos especiales y espacios extra de un texto ya en minúsculas."""
     # Eliminar caracteres especiales excepto letras, números, espacios y comas
-    text = re.sub(r'[^\w\s,áéíóúüñ]', ' ', text)
+    text = _SPECIAL_CHARS_RE.sub(' ', text)
     
     # Reemplazar múltiples espacios con uno solo
-    text = re.sub(r'\s+', ' ', text)
+    text = _WHITESPACE_RE.sub(' ', text)
     
     return text.strip()
 
 def extract_profile(section_text):
     """
-    Extrae información relevante del perfil.
+    Extrae información relevante del perfil a partir del texto normalizado de la sección.
     Retorna un texto normalizado.
     """
-    # Limpiar y normalizar
-    normalized = normalize_text(section_text)
+    normalized = section_text
     
     # Para el perfil, conservamos todo el contenido como un solo texto
     # pero limitamos a las primeras 200 palabras si es muy largo
@@ -103,18 +183,10 @@ def extract_profile(section_text):
 
 def extract_education(section_text):
     """
-    Extrae información de educación y formación.
+    Extrae información de educación y formación a partir del texto normalizado de la sección.
     Retorna un texto normalizado separado por comas.
     """
-    # Normalizar texto
-    normalized = normalize_text(section_text)
-    
-    # Buscar títulos académicos comunes
-    education_keywords = [
-        'licenciatura', 'licenciado', 'ingeniero', 'ingeniería', 'técnico', 
-        'máster', 'master', 'doctorado', 'phd', 'grado', 'bachiller', 'profesional', 'maestría',
-        'diplomado', 'curso', 'certificación', 'certificado', 'formación', 'especialización', 'postgrado',
-    ]
+    normalized = section_text
     
     # Dividir por líneas
     lines = normalized.split('\n')
@@ -126,10 +198,10 @@ def extract_education(section_text):
             continue
             
         # Si la línea contiene alguna palabra clave de educación, agregarla
-        if any(keyword in line for keyword in education_keywords):
+        if _EDUCATION_RE.search(line):
             education_items.append(line)
         # O si contiene años (posible indicador de periodo educativo)
-        elif re.search(r'\b(19|20)\d{2}\b', line):
+        elif _YEAR_RE.search(line):
             education_items.append(line)
     
     # Si no se encontraron elementos con keywords, usar los primeros 5 items no vacíos
@@ -141,18 +213,10 @@ def extract_education(section_text):
 
 def extract_experience(section_text):
     """
-    Extrae información de experiencia laboral.
+    Extrae información de experiencia laboral a partir del texto normalizado de la sección.
     Retorna un texto normalizado separado por comas.
     """
-    # Normalizar texto
-    normalized = normalize_text(section_text)
-    
-    # Buscar posiciones laborales comunes
-    position_keywords = [
-        'director', 'gerente', 'jefe', 'coordinador', 'supervisor', 'analista',
-        'desarrollador', 'ingeniero', 'técnico', 'asistente', 'consultor',
-        'encargado', 'responsable'
-    ]
+    normalized = section_text
     
     # Dividir por líneas
     lines = normalized.split('\n')
@@ -164,10 +228,10 @@ def extract_experience(section_text):
             continue
             
         # Si la línea contiene alguna palabra clave de posición, agregarla
-        if any(keyword in line for keyword in position_keywords):
+        if _POSITION_RE.search(line):
             experience_items.append(line)
         # O si contiene años (posible indicador de periodo laboral)
-        elif re.search(r'\b(19|20)\d{2}\b', line):
+        elif _YEAR_RE.search(line):
             experience_items.append(line)
     
     # Si no se encontraron elementos con keywords, usar los primeros 5 items no vacíos
@@ -179,20 +243,10 @@ def extract_experience(section_text):
 
 def extract_skills(section_text):
     """
-    Extrae habilidades del texto.
+    Extrae habilidades a partir del texto normalizado de la sección.
     Retorna un texto normalizado separado por comas.
     """
-    # Normalizar texto
-    normalized = normalize_text(section_text)
-    
-    # Lista de habilidades técnicas comunes para identificar
-    technical_skills = [
-        'java', 'python', 'c++', 'javascript', 'html', 'css', 'sql', 'php',
-        'ruby', 'excel', 'word', 'powerpoint', 'linux', 'windows', 'docker',
-        'aws', 'azure', 'office', 'sap', 'jira', 'git', 'react', 'angular',
-        'vue', 'node.js', 'django', 'flask', 'spring', 'rest', 'api',
-        'mongodb', 'mysql', 'postgresql', 'oracle'
-    ]
+    normalized = section_text
     
     # Dividir por líneas y extraer habilidades
     lines = normalized.split('\n')
@@ -204,12 +258,12 @@ def extract_skills(section_text):
             continue
             
         # Si la línea empieza con viñeta o guión (común en listas de habilidades)
-        if line.startswith('-') or line.startswith('•'):
-            skill = line.lstrip('- •').strip()
+        if line.startswith(_BULLETS):
+            skill = line.lstrip(_BULLET_STRIP).strip()
             if skill:
                 skills.append(skill)
         # Si la línea contiene alguna habilidad técnica conocida
-        elif any(skill in line for skill in technical_skills):
+        elif _SKILL_RE.search(line):
             skills.append(line)
         # O si es una línea corta (posible skill individual)
         elif len(line.split()) <= 5:
@@ -217,17 +271,41 @@ def extract_skills(section_text):
     
     # Si no se encontraron habilidades, usar las keywords técnicas que aparezcan en el texto
     if not skills:
-        for skill in technical_skills:
+        for skill in _TECHNICAL_SKILLS:
             if skill in normalized:
                 skills.append(skill)
     
     # Unir con comas
     return ', '.join(skills)
 
+def compute_file_hash(file_path):
+    """
+    Calcula un hash rápido (no criptográfico) del contenido de un archivo.
+    Incluye _EXTRACTOR_VERSION para invalidar los JSON generados por versiones
+    anteriores de la extracción.
+    """
+    with open(file_path, 'rb') as f:
+        # Los archivos grandes se hashean desde un mmap, sin copiarlos a memoria
+        if os.fstat(f.fileno()).st_size > _MAX_IN_MEMORY_PDF_SIZE:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return _content_hash(data)
+        return _content_hash(f.read())
+
+def _content_hash(data):
+    """Hash del contenido de un archivo (bytes o mmap) junto con la versión del extractor."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(_EXTRACTOR_VERSION.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(data)
+    return digest.hexdigest()
+
 def process_cv_simplified(pdf_path, output_dir="outputs/extracted"):
     """
     Procesa un CV en PDF, extrae información simplificada y la guarda en JSON.
     
+    Junto al JSON se guarda el hash del PDF (archivo .hash); si el PDF no ha
+    cambiado desde la última ejecución, se reutiliza el JSON existente.
+    
     Args:
         pdf_path: Ruta al archivo PDF del CV
         output_dir: Directorio donde se guardarán los archivos JSON
@@ -235,8 +313,31 @@ def process_cv_simplified(pdf_path, output_dir="outputs/extracted"):
     Returns:
         La ruta al archivo JSON generado o None si hubo un error
     """
+    filename = os.path.basename(pdf_path)
+    output_filename = os.path.splitext(filename)[0] + ".json"
+    output_path = os.path.join(output_dir, output_filename)
+    hash_path = output_path + ".hash"
+    
+    # Omitir el procesamiento si el PDF no cambió desde la última vez. Los PDFs
+    # pequeños se leen una sola vez: los mismos bytes sirven para el hash y para abrirlos
+    try:
+        pdf_data = _read_small_pdf(pdf_path)
+        if pdf_data is not None:
+            source_hash = _content_hash(pdf_data)
+        else:
+            source_hash = compute_file_hash(pdf_path)
+    except Exception as e:
+        print(f"Error leyendo PDF {pdf_path}: {e}")
+        return None
+    
+    if os.path.exists(output_path) and os.path.exists(hash_path):
+        with open(hash_path, 'r', encoding='utf-8') as f:
+            if f.read().strip() == source_hash:
+                print(f"CV sin cambios, usando JSON existente: {output_path}")
+                return output_path
+    
     # Extraer el texto completo del PDF
-    text = extract_text_from_pdf(pdf_path)
+    text = extract_text_from_pdf(pdf_path, pdf_data)
     if not text:
         return None
     
@@ -252,16 +353,13 @@ def process_cv_simplified(pdf_path, output_dir="outputs/extracted"):
     }
     
     # Guardar en JSON
-    filename = os.path.basename(pdf_path)
-    output_filename = os.path.splitext(filename)[0] + ".json"
-    output_path = os.path.join(output_dir, output_filename)
-    
     try:
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(cv_data, f, ensure_ascii=False, indent=4)
+        dump_json(cv_data, output_path)
+        with open(hash_path, 'w', encoding='utf-8') as f:
+            f.write(source_hash)
         print(f"JSON guardado en: {output_path}")
         return output_path
     except Exception as e:
         print(f"Error al guardar JSON: {e}")
-        return None
\ No newline at end of file
+        return None
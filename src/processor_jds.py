@@ -1,60 +1,117 @@
 # -*- coding: utf-8 -*-
 import re
-import json
 import os
+import mmap
+import codecs
 from pathlib import Path
 
+from json_utils import dump_json
+
+# Patrones precompilados para el inicio de cada sección
+_SECTION_PATTERNS = {
+    name: re.compile(pattern)
+    for name, pattern in {
+        'descripcion': r'(?:sobre el rol|descripción del puesto|acerca del rol|oportunidad laboral|acerca de la posición|descripción|sobre nosotros|buscamos|búsqueda|busqueda|oportunidad)',
+        'responsabilidades': r'(?:responsabilidades|funciones|tareas|actividades|lo que harás|objetivos|responsabilidades clave|objetivo)',
+        'formacion': r'(?:formación|académica|académicos|educación|estudios|certificación|certificaciones|profesional|perfil|experiencia requerida)',
+        'habilidades': r'(?:habilidades|competencias|conocimientos|skills|competencias clave|certificaciones|tecnologías|herramientas|lenguajes|sistemas|stack)'
+    }.items()
+}
+
+# Viñetas que marcan elementos de una lista
+_BULLETS = ('-', '•', '*')
+_BULLET_STRIP = '- •*'
+
+# Patrones precompilados para la normalización y extracción
+_SPECIAL_CHARS_RE = re.compile(r'[^\w\s,áéíóúüñ]')
+_RESP_VERB_RE = re.compile(r'^(desarrollar|diseñar|implementar|crear|gestionar|administrar|coordinar|mantener|analizar)\b')
+
+# Palabras clave para identificar requisitos académicos
+_EDUCATION_KEYWORDS = [
+    'ingeniería', 'licenciatura', 'título', 'grado', 'carrera', 'universitario',
+    'técnico', 'profesional', 'maestría', 'máster', 'doctorado', 'postgrado',
+    'certificación', 'diplomado'
+]
+
+# Lista de habilidades técnicas comunes para identificar
+_TECHNICAL_SKILLS = [
+    'java', 'python', 'c++', 'javascript', 'html', 'css', 'sql', 'php',
+    'ruby', 'excel', 'word', 'powerpoint', 'linux', 'windows', 'docker',
+    'aws', 'azure', 'office', 'sap', 'jira', 'git', 'react', 'angular',
+    'vue', 'node.js', 'django', 'flask', 'spring', 'rest', 'api',
+    'mongodb', 'mysql', 'postgresql', 'oracle', 'databricks', 'spark',
+    'powerbi', 'power bi', 'tableau', 'data warehouse', 'etl', 'power automate',
+    'machine learning', 'data lake', 'big data', 'hadoop', 'kubernetes',
+    'microservices', 'jenkins', 'devops', 'agile', 'scrum'
+]
+
+# Alternación precompilada de las palabras clave académicas
+_EDUCATION_RE = re.compile('|'.join(re.escape(k) for k in _EDUCATION_KEYWORDS))
+
+# Cada habilidad como palabra completa
+_SKILL_WORD_RES = {
+    skill: re.compile(r'\b' + re.escape(skill) + r'\b')
+    for skill in _TECHNICAL_SKILLS
+}
+
+# Tamaño (bytes) a partir del cual un JD se lee mediante mmap
+_MMAP_MIN_SIZE = 1024 * 1024
+
+# Prefijo (bytes) que se valida como UTF-8 antes de decodificar el archivo completo
+_ENCODING_SNIFF_SIZE = 8 * 1024
+_UTF8_DECODER = codecs.getincrementaldecoder('utf-8')
+
+# Marcas de orden de bytes (BOM) y la codificación que indican
+_BOM_ENCODINGS = (
+    (b'\xef\xbb\xbf', 'utf-8-sig'),
+    (b'\xff\xfe', 'utf-16'),
+    (b'\xfe\xff', 'utf-16'),
+)
+
 def read_jd_file(file_path):
     """
     Lee un archivo de descripción de trabajo (JD) con manejo de diferentes codificaciones.
+    El archivo se lee una sola vez en binario; la codificación se deduce del BOM
+    y, si no hay BOM, se prueba UTF-8 con latin-1 como último recurso.
     """
-    # Lista de codificaciones a intentar
-    encodings = ['utf-8', 'latin-1', 'utf-16', 'utf-16-le', 'utf-16-be', 'cp1252']
-    
-    for encoding in encodings:
-        try:
-            with open(file_path, 'r', encoding=encoding) as file:
-                text = file.read()
-                # Verificar si el texto no contiene solo caracteres extraños
-                if len(text.strip()) > 0:
-                    return text
-        except UnicodeDecodeError:
-            continue
-        except Exception as e:
-            print(f"Error leyendo archivo {file_path}: {e}")
-            return None
-    
-    # Si todas las codificaciones fallan, intentar leer en modo binario y decodificar manualmente
     try:
         with open(file_path, 'rb') as file:
-            raw_data = file.read()
-            # Detectar y eliminar BOM si existe
-            if raw_data.startswith(b'\xff\xfe') or raw_data.startswith(b'\xfe\xff'):
-                # Es un archivo UTF-16 con BOM
-                text = raw_data.decode('utf-16')
-                return text
-            
-            # Probar decodificaciones seguras para datos binarios
-            for encoding in ['utf-8-sig', 'utf-16', 'latin-1']:
-                try:
-                    text = raw_data.decode(encoding)
-                    # Verificar que el texto decodificado tenga sentido (no solo caracteres raros)
-                    if len(text.strip()) > 0:
-                        return text
-                except UnicodeDecodeError:
-                    continue
-            
-            # Último recurso, forzar decodificación ignorando errores
-            return raw_data.decode('latin-1', errors='ignore')
-            
+            # Los archivos grandes se decodifican directamente desde un mmap,
+            # sin copiar antes todo su contenido a un objeto bytes
+            if os.fstat(file.fileno()).st_size >= _MMAP_MIN_SIZE:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as raw_data:
+                    text = _decode_jd(raw_data)
+            else:
+                text = _decode_jd(file.read())
     except Exception as e:
-        print(f"Error en último intento de lectura {file_path}: {e}")
+        print(f"Error leyendo archivo {file_path}: {e}")
         return None
+    
+    # Normalizar saltos de línea como en la lectura en modo texto
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+def _decode_jd(raw_data):
+    """Decodifica el contenido binario de un JD (bytes o mmap) según su BOM."""
+    # Detectar la codificación por el BOM si existe
+    for bom, encoding in _BOM_ENCODINGS:
+        if raw_data[:len(bom)] == bom:
+            return str(raw_data, encoding, 'ignore')
+    
+    try:
+        # Validar primero un prefijo: si ya no es UTF-8 se evita decodificar
+        # el archivo completo dos veces. El decodificador incremental tolera
+        # un carácter multibyte cortado al final del prefijo
+        _UTF8_DECODER().decode(raw_data[:_ENCODING_SNIFF_SIZE], final=False)
+        return str(raw_data, 'utf-8')
+    except UnicodeDecodeError:
+        # latin-1 decodifica cualquier secuencia de bytes
+        return str(raw_data, 'latin-1')
 
 def identify_sections(text):
     """
     Identifica las secciones principales de un JD.
-    Devuelve un diccionario con las secciones encontradas.
+    Devuelve un diccionario con las secciones encontradas, con su contenido ya
+    en minúsculas (los extractores no vuelven a convertirlo).
     """
     # Convertir texto a minúsculas para facilitar la identificación de secciones
     text_lower = text.lower()
@@ -62,17 +119,9 @@ def identify_sections(text):
     # Diccionario para almacenar las posiciones de inicio de cada sección
     section_starts = {}
     
-    # Patrones para el inicio de cada sección
-    section_patterns = {
-        'descripcion': r'(?:sobre el rol|descripción del puesto|acerca del rol|oportunidad laboral|acerca de la posición|descripción|sobre nosotros|buscamos|búsqueda|busqueda|oportunidad)',
-        'responsabilidades': r'(?:responsabilidades|funciones|tareas|actividades|lo que harás|objetivos|responsabilidades clave|objetivo)',
-        'formacion': r'(?:formación|académica|académicos|educación|estudios|certificación|certificaciones|profesional|perfil|experiencia requerida)',
-        'habilidades': r'(?:habilidades|competencias|conocimientos|skills|competencias clave|certificaciones|tecnologías|herramientas|lenguajes|sistemas|stack)'
-    }
-    
     # Encontrar dónde comienza cada sección
-    for section_name, pattern in section_patterns.items():
-        matches = re.search(pattern, text_lower)
+    for section_name, pattern in _SECTION_PATTERNS.items():
+        matches = pattern.search(text_lower)
         if matches:
             section_starts[section_name] = matches.start()
     
@@ -86,15 +135,15 @@ def identify_sections(text):
     # Crear diccionario con el contenido de cada sección
     sections = {}
     
-    # Para cada sección, extraer su contenido
+    # Para cada sección, extraer su contenido del texto ya en minúsculas
     for i, (section_name, start_pos) in enumerate(sorted_sections):
         # Si es la última sección, su contenido va hasta el final
         if i == len(sorted_sections) - 1:
-            section_content = text[start_pos:]
+            section_content = text_lower[start_pos:]
         else:
             # Si no es la última, su contenido va hasta donde empieza la siguiente
             next_section_start = sorted_sections[i + 1][1]
-            section_content = text[start_pos:next_section_start]
+            section_content = text_lower[start_pos:next_section_start]
         
         sections[section_name] = section_content.strip()
     
@@ -112,19 +161,39 @@ def normalize_text(text):
         return ""
         
     # Convertir a minúsculas
-    text = text.lower()
-    
+    return _clean_text(text.lower())
+
+def _clean_text(text):
+    """Elimina signos especiales y espacios extra de un texto ya en minúsculas."""
     # Eliminar caracteres especiales excepto letras, números, espacios y comas
-    text = re.sub(r'[^\w\s,áéíóúüñ]', ' ', text)
+    text = _SPECIAL_CHARS_RE.sub(' ', text)
     
-    # Reemplazar múltiples espacios con uno solo
-    text = re.sub(r'\s+', ' ', text)
+    # Reemplazar múltiples espacios con uno solo (split/join también recorta los extremos)
+    return ' '.join(text.split())
+
+def _normalize_lines(section_text):
+    """
+    Normaliza una sección (en minúsculas) línea a línea, conservando la
+    división en líneas que normalize_text colapsa. Las viñetas se detectan
+    antes de normalizar, ya que la normalización elimina esos caracteres.
+    Retorna una lista de tuplas (es_viñeta, línea normalizada) sin líneas vacías.
+    """
+    lines = []
+    for line in section_text.split('\n'):
+        line = line.strip()
+        is_bullet = line.startswith(_BULLETS)
+        if is_bullet:
+            line = line.lstrip(_BULLET_STRIP)
+        
+        line = _clean_text(line)
+        if line:
+            lines.append((is_bullet, line))
     
-    return text.strip()
+    return lines
 
 def extract_description(section_text):
     """
-    Extrae la descripción del JD.
+    Extrae la descripción del JD a partir del texto en minúsculas de la sección.
     Retorna un texto normalizado.
     """
     if not section_text:
@@ -135,8 +204,8 @@ def extract_description(section_text):
     if len(lines) > 1:
         section_text = '\n'.join(lines[1:]).strip()
     
-    # Normalizar texto
-    normalized = normalize_text(section_text)
+    # Normalizar texto (ya está en minúsculas)
+    normalized = _clean_text(section_text)
     
     # Para la descripción, conservamos todo el contenido como un solo texto
     # pero limitamos a las primeras 200 palabras si es muy largo
@@ -148,7 +217,7 @@ def extract_description(section_text):
 
 def extract_responsibilities(section_text):
     """
-    Extrae las responsabilidades del JD.
+    Extrae las responsabilidades del JD a partir del texto en minúsculas de la sección.
     Retorna un texto normalizado separado por comas.
     """
     if not section_text:
@@ -159,21 +228,18 @@ def extract_responsibilities(section_text):
     if len(lines) > 1:
         section_text = '\n'.join(lines[1:]).strip()
     
-    # Normalizar texto
-    normalized = normalize_text(section_text)
+    # Normalizar texto línea a línea (normalize_text colapsa los saltos de línea)
+    lines = _normalize_lines(section_text)
+    normalized = ' '.join(line for _, line in lines)
     
     # Dividir por líneas o puntos para identificar items individuales
     items = []
-    for line in normalized.split('\n'):
-        line = line.strip()
-        if not line:
-            continue
-            
+    for is_bullet, line in lines:
         # Si la línea comienza con un punto, guión o asterisco, es un item
-        if line.startswith('-') or line.startswith('•') or line.startswith('*'):
-            items.append(line.lstrip('- •*').strip())
+        if is_bullet:
+            items.append(line)
         # Si contiene verbos en infinitivo al inicio (comunes en responsabilidades)
-        elif re.match(r'^(desarrollar|diseñar|implementar|crear|gestionar|administrar|coordinar|mantener|analizar)\b', line):
+        elif _RESP_VERB_RE.match(line):
             items.append(line)
         elif len(items) == 0:  # Si aún no hemos añadido nada, tomar las líneas como items individuales
             items.append(line)
@@ -187,7 +253,7 @@ def extract_responsibilities(section_text):
 
 def extract_education(section_text):
     """
-    Extrae los requisitos académicos/formación del JD.
+    Extrae los requisitos académicos/formación del JD a partir del texto en minúsculas de la sección.
     Retorna un texto normalizado separado por comas.
     """
     if not section_text:
@@ -198,38 +264,20 @@ def extract_education(section_text):
     if len(lines) > 1:
         section_text = '\n'.join(lines[1:]).strip()
     
-    # Normalizar texto
-    normalized = normalize_text(section_text)
-    
-    # Palabras clave para identificar requisitos académicos
-    education_keywords = [
-        'ingeniería', 'licenciatura', 'título', 'grado', 'carrera', 'universitario',
-        'técnico', 'profesional', 'maestría', 'máster', 'doctorado', 'postgrado',
-        'certificación', 'diplomado'
-    ]
+    # Normalizar texto línea a línea (normalize_text colapsa los saltos de línea)
+    lines = _normalize_lines(section_text)
+    normalized = ' '.join(line for _, line in lines)
     
     # Buscar líneas que contengan palabras clave de educación
     education_items = []
-    for line in normalized.split('\n'):
-        line = line.strip()
-        if not line:
-            continue
-            
+    for _, line in lines:
         # Si la línea contiene alguna palabra clave de educación, agregarla
-        if any(keyword in line for keyword in education_keywords):
+        if _EDUCATION_RE.search(line):
             education_items.append(line)
     
-    # Si no se encontraron items específicos, buscar en el texto completo
-    if not education_items:
-        # Intentar encontrar frases con palabras clave
-        for keyword in education_keywords:
-            pattern = re.compile(r'[^.!?]*\b' + keyword + r'\b[^.!?]*[.!?]')
-            matches = pattern.findall(normalized)
-            education_items.extend(matches)
-    
-    # Si aún no hay items, tomar las primeras líneas que mencionan formación
+    # Si no hay items, tomar las primeras líneas que mencionan formación
     if not education_items and 'formación' in normalized:
-        for line in normalized.split('\n'):
+        for _, line in lines:
             if 'formación' in line or 'experiencia' in line:
                 education_items.append(line)
                 break
@@ -243,7 +291,7 @@ def extract_education(section_text):
 
 def extract_skills(section_text):
     """
-    Extrae las habilidades técnicas y competencias del JD.
+    Extrae las habilidades técnicas y competencias del JD a partir del texto en minúsculas de la sección.
     Retorna un texto normalizado separado por comas.
     """
     if not section_text:
@@ -254,43 +302,28 @@ def extract_skills(section_text):
     if len(lines) > 1:
         section_text = '\n'.join(lines[1:]).strip()
     
-    # Normalizar texto
-    normalized = normalize_text(section_text)
-    
-    # Lista de habilidades técnicas comunes para identificar
-    technical_skills = [
-        'java', 'python', 'c++', 'javascript', 'html', 'css', 'sql', 'php',
-        'ruby', 'excel', 'word', 'powerpoint', 'linux', 'windows', 'docker',
-        'aws', 'azure', 'office', 'sap', 'jira', 'git', 'react', 'angular',
-        'vue', 'node.js', 'django', 'flask', 'spring', 'rest', 'api',
-        'mongodb', 'mysql', 'postgresql', 'oracle', 'databricks', 'spark',
-        'powerbi', 'power bi', 'tableau', 'data warehouse', 'etl', 'power automate',
-        'machine learning', 'data lake', 'big data', 'hadoop', 'kubernetes',
-        'microservices', 'jenkins', 'devops', 'agile', 'scrum'
-    ]
+    # Normalizar texto línea a línea (normalize_text colapsa los saltos de línea)
+    lines = _normalize_lines(section_text)
+    normalized = ' '.join(line for _, line in lines)
     
     # Dividir por líneas y extraer habilidades
     skills = []
     
     # Primero, buscar líneas que comiencen con viñetas o guiones
-    for line in normalized.split('\n'):
-        line = line.strip()
-        if not line:
-            continue
-            
+    for is_bullet, line in lines:
         # Si la línea empieza con viñeta o guión (común en listas de habilidades)
-        if line.startswith('-') or line.startswith('•') or line.startswith('*'):
-            skill = line.lstrip('- •*').strip()
-            if skill:
-                skills.append(skill)
+        if is_bullet:
+            skills.append(line)
     
     # Si no se encontraron items con viñetas, buscar tecnologías específicas
     if not skills:
-        for skill in technical_skills:
+        # El texto normalizado solo conserva las comas como separadores de frase:
+        # el contexto de una habilidad es el fragmento entre comas que la contiene
+        clauses = normalized.split(',')
+        for skill, pattern in _SKILL_WORD_RES.items():
             if skill in normalized:
                 # Buscar el contexto alrededor de la habilidad
-                pattern = re.compile(r'[^.!?,]*\b' + skill + r'\b[^.!?,]*')
-                matches = pattern.findall(normalized)
+                matches = [clause for clause in clauses if pattern.search(clause)]
                 if matches:
                     skills.extend(matches)
                 else:
@@ -298,22 +331,16 @@ def extract_skills(section_text):
     
     # Si aún no hay skills identificadas, tomar las líneas cortas como posibles habilidades
     if not skills:
-        for line in normalized.split('\n'):
-            line = line.strip()
-            if line and len(line.split()) <= 5:  # Líneas cortas podrían ser habilidades
+        for _, line in lines:
+            if len(line.split()) <= 5:  # Líneas cortas podrían ser habilidades
                 skills.append(line)
     
     # Si sigue sin haber skills, devolver el texto normalizado
     if not skills:
         return normalized
     
-    # Eliminar duplicados y unir con comas
-    unique_skills = []
-    for skill in skills:
-        if skill not in unique_skills:
-            unique_skills.append(skill)
-    
-    return ', '.join(unique_skills)
+    # Eliminar duplicados (conservando el orden) y unir con comas
+    return ', '.join(dict.fromkeys(skills))
 
 def process_jd(jd_path, output_dir="outputs/extracted"):
     """
@@ -350,7 +377,7 @@ def process_jd(jd_path, output_dir="outputs/extracted"):
     if not sections:
         print("No se identificaron secciones, usando todo el texto como descripción")
         sections = {
-            'descripcion': text
+            'descripcion': text.lower()
         }
     else:
         print(f"Secciones identificadas: {', '.join(sections.keys())}")
@@ -370,8 +397,7 @@ def process_jd(jd_path, output_dir="outputs/extracted"):
     
     try:
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(jd_data, f, ensure_ascii=False, indent=4)
+        dump_json(jd_data, output_path)
         print(f"JSON guardado en: {output_path}")
         return output_path
     except Exception as e:
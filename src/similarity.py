@@ -1,9 +1,13 @@
 import os
-import json
+import hashlib
 import numpy as np
-from functools import lru_cache
+import torch
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from sentence_transformers import SentenceTransformer
 
+from json_utils import dump_json, load_json
+
 # Configuración de modelos y secciones
 CONFIG = {
     "models": {
@@ -35,17 +39,135 @@ CONFIG = {
     }
 }
 
+# Número máximo de hilos para leer y escribir archivos JSON
+MAX_IO_WORKERS = 8
+
 # Cache para modelos (se cargan solo cuando se necesitan)
 _MODELS = {}
 
 def get_model(model_type):
-    """Obtiene un modelo de embeddings (con carga perezosa)"""
+    """
+    Obtiene un modelo de embeddings (con carga perezosa).
+    SentenceTransformer usa la GPU automáticamente si está disponible; en ese
+    caso el modelo se pasa a media precisión (fp16) para acelerar la inferencia.
+    """
     if model_type not in _MODELS:
         model_name = CONFIG["models"][model_type]
-        _MODELS[model_type] = SentenceTransformer(model_name)
+        model = SentenceTransformer(model_name)
+        if model.device.type == "cuda":
+            model.half()
+        _MODELS[model_type] = model
     return _MODELS[model_type]
 
-@lru_cache(maxsize=100)
+# Caché LRU en memoria de embeddings, indexada por hash del texto y modelo
+_EMBEDDINGS = OrderedDict()
+EMBEDDING_CACHE_SIZE = 4096
+
+# Directorio de la caché en disco, compartida entre ejecuciones y procesos
+EMBEDDING_CACHE_DIR = "outputs/.embedding_cache"
+
+def _embedding_precision():
+    """
+    Precisión de los embeddings que genera get_model: los modelos se cargan en
+    la GPU cuando está disponible y allí se pasan a fp16.
+    """
+    return "fp16" if torch.cuda.is_available() else "fp32"
+
+def _embedding_key(text, model_type):
+    """
+    Genera una clave corta a partir del texto, el modelo que lo codifica y su
+    precisión, para no mezclar en la caché vectores fp16 (GPU) y fp32 (CPU).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(CONFIG["models"][model_type].encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(_embedding_precision().encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(text.encode('utf-8'))
+    return digest.hexdigest()
+
+def _cache_get(key):
+    """
+    Obtiene un embedding de la caché en memoria o, si no está, de la caché en disco.
+    Devuelve None si no existe en ninguna de las dos.
+    """
+    embedding = _EMBEDDINGS.get(key)
+    if embedding is not None:
+        _EMBEDDINGS.move_to_end(key)
+        return embedding
+    
+    try:
+        embedding = np.load(os.path.join(EMBEDDING_CACHE_DIR, f"{key}.npy"))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Entrada de caché de embeddings inválida {key}: {e}")
+        return None
+    
+    _remember(key, embedding)
+    return embedding
+
+def _cache_put(key, embedding):
+    """Guarda un embedding en la caché en memoria y en disco."""
+    _remember(key, embedding)
+    try:
+        os.makedirs(EMBEDDING_CACHE_DIR, exist_ok=True)
+        np.save(os.path.join(EMBEDDING_CACHE_DIR, f"{key}.npy"), embedding)
+    except Exception as e:
+        print(f"No se pudo guardar el embedding en caché: {e}")
+
+def _remember(key, embedding):
+    """Guarda un embedding en memoria, descartando el menos usado si está llena."""
+    _EMBEDDINGS[key] = embedding
+    _EMBEDDINGS.move_to_end(key)
+    if len(_EMBEDDINGS) > EMBEDDING_CACHE_SIZE:
+        _EMBEDDINGS.popitem(last=False)
+
+def get_embeddings(texts, is_short=True):
+    """
+    Genera embeddings normalizados (norma L2 = 1) para varios textos con una
+    sola llamada al modelo. Los textos ya calculados se toman de la caché (en
+    memoria o en disco, ver EMBEDDING_CACHE_DIR) y solo se codifican los nuevos.
+    
+    Args:
+        texts (list): Textos para generar embeddings
+        is_short (bool): Si es True, usa modelo para textos cortos
+        
+    Returns:
+        list: Un numpy.ndarray por texto, en el mismo orden
+    """
+    model_type = "short" if is_short else "long"
+    embeddings = [None] * len(texts)
+    pending = {}
+    
+    for i, text in enumerate(texts):
+        if not text or len(text.strip()) == 0:
+            # Devolver vector de ceros con dimensiones adecuadas
+            dim = 384 if is_short else 768
+            embeddings[i] = np.zeros(dim, dtype=np.float32)
+            continue
+        
+        key = _embedding_key(text, model_type)
+        cached = _cache_get(key)
+        if cached is not None:
+            embeddings[i] = cached
+        else:
+            pending.setdefault(key, (text, []))[1].append(i)
+    
+    # Codificar todos los textos nuevos en un único lote
+    if pending:
+        new_texts = [text for text, _ in pending.values()]
+        model = get_model(model_type)
+        vectors = model.encode(new_texts, convert_to_numpy=True, normalize_embeddings=True)
+        # Los modelos en fp16 devuelven float16; se mantiene float32 en todos los casos
+        vectors = np.asarray(vectors, dtype=np.float32)
+        for (key, (_, positions)), vector in zip(pending.items(), vectors):
+            _cache_put(key, vector)
+            for i in positions:
+                embeddings[i] = vector
+    
+    return embeddings
+
 def get_embedding(text, is_short=True):
     """
     Genera embedding para un texto usando el modelo adecuado.
@@ -56,42 +178,66 @@ def get_embedding(text, is_short=True):
         is_short (bool): Si es True, usa modelo para textos cortos
         
     Returns:
-        numpy.ndarray: Vector de embedding
+        numpy.ndarray: Vector de embedding normalizado
     """
-    if not text or len(text.strip()) == 0:
-        # Devolver vector de ceros con dimensiones adecuadas
-        dim = 384 if is_short else 768
-        return np.zeros(dim)
-        
-    model_type = "short" if is_short else "long"
-    model = get_model(model_type)
-    return model.encode(text, convert_to_numpy=True)
+    return get_embeddings([text], is_short)[0]
 
 def cosine_similarity(vec1, vec2):
     """
     Calcula similitud coseno entre dos vectores.
+    Los embeddings se generan ya normalizados (norma L2 = 1), por lo que la
+    similitud coseno se reduce al producto escalar. Los vectores de ceros
+    (textos vacíos) dan similitud 0.
     
     Args:
-        vec1, vec2 (numpy.ndarray): Vectores a comparar
+        vec1, vec2 (numpy.ndarray): Vectores normalizados a comparar
         
     Returns:
         float: Similitud coseno [0,1]
     """
-    # Evitar división por cero
-    if np.all(vec1 == 0) or np.all(vec2 == 0):
-        return 0.0
-    
-    similarity = np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
+    similarity = np.dot(vec1, vec2)
     # Normalizamos a [0,1], aunque generalmente ya está en ese rango
     return max(0.0, min(float(similarity), 1.0))
 
-def compare_sections(cv_data, jd_data):
+def embed_sections(documents, side="cv"):
     """
-    Compara todas las secciones relevantes entre un CV y un JD.
+    Genera los embeddings de las secciones de varios documentos, codificando
+    todos los textos del mismo tipo de modelo en una sola llamada.
     
     Args:
-        cv_data (dict): Datos del CV
-        jd_data (dict): Datos del JD
+        documents (list): Datos (dict) de cada documento
+        side (str): "cv" o "jd", indica qué lado de CONFIG["sections_map"] usar
+        
+    Returns:
+        list: Por cada documento, un dict {sección: embedding}
+    """
+    # Agrupar los textos por tipo de modelo. Cada sección usa el modelo de su
+    # sección de CV para que ambos lados sean comparables
+    texts_by_type = {True: [], False: []}
+    slots_by_type = {True: [], False: []}
+    for index, data in enumerate(documents):
+        for cv_section, jd_section in CONFIG["sections_map"].items():
+            section = cv_section if side == "cv" else jd_section
+            is_short_section = CONFIG["section_types"].get(cv_section, True)
+            texts_by_type[is_short_section].append(data.get(section, ""))
+            slots_by_type[is_short_section].append((index, section))
+    
+    embeddings = [{} for _ in documents]
+    for is_short, texts in texts_by_type.items():
+        if texts:
+            vectors = get_embeddings(texts, is_short)
+            for (index, section), vector in zip(slots_by_type[is_short], vectors):
+                embeddings[index][section] = vector
+    
+    return embeddings
+
+def compare_embeddings(cv_embeddings, jd_embeddings):
+    """
+    Compara los embeddings de las secciones de un CV y un JD.
+    
+    Args:
+        cv_embeddings (dict): Embeddings por sección del CV (ver embed_sections)
+        jd_embeddings (dict): Embeddings por sección del JD (ver embed_sections)
         
     Returns:
         dict: Scores por sección y total
@@ -100,20 +246,9 @@ def compare_sections(cv_data, jd_data):
     
     # Procesar cada sección del CV con su equivalente en JD
     for cv_section, jd_section in CONFIG["sections_map"].items():
-        # Obtener el tipo de sección (corta o larga)
-        is_short_section = CONFIG["section_types"].get(cv_section, True)
-        
-        # Extraer texto de ambos documentos
-        cv_text = cv_data.get(cv_section, "")
-        jd_text = jd_data.get(jd_section, "")
-        
-        # Generar embeddings
-        cv_embedding = get_embedding(cv_text, is_short_section)
-        jd_embedding = get_embedding(jd_text, is_short_section)
-        
         # Calcular similitud
         section_key = f"{cv_section}_{jd_section}"
-        scores[section_key] = cosine_similarity(cv_embedding, jd_embedding)
+        scores[section_key] = cosine_similarity(cv_embeddings[cv_section], jd_embeddings[jd_section])
     
     # Calcular score total ponderado
     total_score = sum(
@@ -126,7 +261,54 @@ def compare_sections(cv_data, jd_data):
         "total_score": total_score
     }
 
-def compare_cv_to_jds(cv_path, jd_paths, output_dir="outputs/scores"):
+def compare_sections(cv_data, jd_data):
+    """
+    Compara todas las secciones relevantes entre un CV y un JD.
+    
+    Args:
+        cv_data (dict): Datos del CV
+        jd_data (dict): Datos del JD
+        
+    Returns:
+        dict: Scores por sección y total
+    """
+    cv_embeddings = embed_sections([cv_data], "cv")[0]
+    jd_embeddings = embed_sections([jd_data], "jd")[0]
+    return compare_embeddings(cv_embeddings, jd_embeddings)
+
+def precompute_jd_embeddings(jd_paths):
+    """
+    Carga una sola vez los JSON de los JDs y genera los embeddings de sus secciones,
+    para reutilizarlos al compararlos con varios CVs.
+    
+    Args:
+        jd_paths (list): Lista de rutas a archivos JSON de JDs
+        
+    Returns:
+        dict: {jd_name: {sección: embedding}}, en el orden de jd_paths
+    """
+    # Leer los JSON en paralelo: la lectura es de E/S y no compite por el GIL
+    with ThreadPoolExecutor(max_workers=MAX_IO_WORKERS) as executor:
+        loaded = list(executor.map(_load_jd, jd_paths))
+    
+    names = []
+    documents = []
+    for jd_path, jd_data in zip(jd_paths, loaded):
+        if jd_data is not None:
+            names.append(os.path.splitext(os.path.basename(jd_path))[0])
+            documents.append(jd_data)
+    
+    return dict(zip(names, embed_sections(documents, "jd")))
+
+def _load_jd(jd_path):
+    """Carga el JSON de un JD, o devuelve None si no se puede leer."""
+    try:
+        return load_json(jd_path)
+    except Exception as e:
+        print(f"Error al procesar JD {jd_path}: {e}")
+        return None
+
+def compare_cv_to_jds(cv_path, jd_paths, output_dir="outputs/scores", jd_embeddings=None):
     """
     Compara un CV con múltiples JDs y guarda los resultados.
     
@@ -134,6 +316,8 @@ def compare_cv_to_jds(cv_path, jd_paths, output_dir="outputs/scores"):
         cv_path (str): Ruta al archivo JSON del CV
         jd_paths (list): Lista de rutas a archivos JSON de JDs
         output_dir (str): Directorio para guardar resultados
+        jd_embeddings (dict): Embeddings ya calculados de los JDs (ver
+            precompute_jd_embeddings); si es None se calculan a partir de jd_paths
         
     Returns:
         list: Resultados ordenados por score
@@ -142,50 +326,57 @@ def compare_cv_to_jds(cv_path, jd_paths, output_dir="outputs/scores"):
     
     # Cargar CV
     try:
-        with open(cv_path, 'r', encoding='utf-8') as f:
-            cv_data = json.load(f)
-            cv_name = os.path.splitext(os.path.basename(cv_path))[0]
+        cv_data = load_json(cv_path)
+        cv_name = os.path.splitext(os.path.basename(cv_path))[0]
     except Exception as e:
         print(f"Error al cargar CV {cv_path}: {e}")
         return []
     
+    if jd_embeddings is None:
+        jd_embeddings = precompute_jd_embeddings(jd_paths)
+    
+    cv_embeddings = embed_sections([cv_data], "cv")[0]
     results = []
     
     # Comparar con cada JD
-    for jd_path in jd_paths:
+    for jd_name, jd_section_embeddings in jd_embeddings.items():
         try:
-            with open(jd_path, 'r', encoding='utf-8') as f:
-                jd_data = json.load(f)
-                jd_name = os.path.splitext(os.path.basename(jd_path))[0]
-            
             # Comparar secciones
-            comparison = compare_sections(cv_data, jd_data)
+            comparison = compare_embeddings(cv_embeddings, jd_section_embeddings)
             
             # Crear resultado completo
-            result = {
+            results.append({
                 "cv_name": cv_name,
                 "jd_name": jd_name,
                 "scores": comparison["section_scores"],
                 "total_score": comparison["total_score"]
-            }
-            
-            # Guardar resultado individual
-            output_file = f"{cv_name}_vs_{jd_name}.json"
-            output_path = os.path.join(output_dir, output_file)
-            
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(result, f, ensure_ascii=False, indent=4)
-            
-            results.append(result)
-            print(f"Comparación: {cv_name} vs {jd_name} - Score: {result['total_score']:.2f}")
-            
+            })
         except Exception as e:
-            print(f"Error al procesar JD {jd_path}: {e}")
+            print(f"Error al procesar JD {jd_name}: {e}")
+    
+    # Guardar los resultados individuales en paralelo
+    with ThreadPoolExecutor(max_workers=MAX_IO_WORKERS) as executor:
+        saved = list(executor.map(lambda result: _save_result(result, output_dir), results))
+    results = [result for result, ok in zip(results, saved) if ok]
+    
+    for result in results:
+        print(f"Comparación: {cv_name} vs {result['jd_name']} - Score: {result['total_score']:.2f}")
     
     # Ordenar resultados por score
     results.sort(key=lambda x: x["total_score"], reverse=True)
     return results
 
+def _save_result(result, output_dir):
+    """Guarda el resultado de una comparación CV-JD. Devuelve True si se guardó."""
+    output_file = f"{result['cv_name']}_vs_{result['jd_name']}.json"
+    output_path = os.path.join(output_dir, output_file)
+    try:
+        dump_json(result, output_path)
+        return True
+    except Exception as e:
+        print(f"Error al procesar JD {result['jd_name']}: {e}")
+        return False
+
 def find_best_matches(cv_name, scores_dir="outputs/scores"):
     """
     Encuentra el mejor JD para un CV específico basado en archivos de resultados existentes.
@@ -207,9 +398,7 @@ def find_best_matches(cv_name, scores_dir="outputs/scores"):
                 file_path = os.path.join(scores_dir, filename)
                 
                 try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        result = json.load(f)
-                        results.append(result)
+                    results.append(load_json(file_path))
                 except Exception as e:
                     print(f"Error al leer archivo {file_path}: {e}")
         